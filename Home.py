@@ -42,7 +42,7 @@ with st.sidebar:
     st.text_input("User", value=st.session_state.user, key="user_display", disabled=True)
 
 
-col1, col2, col3 = st.columns(3)
+col1, col2, col3, col4 = st.columns(4)
 
 with col1:
     st.subheader("🔑 Monthly Access Tool")
@@ -78,4 +78,15 @@ with col3:
     if st.button("Go to DeepL Translation Tool"):
         st.switch_page("pages/DeepL_Translation_API.py")
 
+with col4:
+    st.subheader("🗄️ Volume Warehouse")
+    st.write("""Query volumes from all past pulls
+- Every finished Monthly Access and DataForSEO pull is stored locally\n
+- Filter by keywords, locations, languages and years\n
+- Aggregate monthly, yearly or in total and export to Excel/CSV\n
+- No API calls, no costs
+             """)
+    if st.button("Go to Volume Warehouse"):
+        st.switch_page("pages/Volume_Warehouse.py")
+
 st.markdown("---")
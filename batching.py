@@ -0,0 +1,104 @@
+from collections import deque
+
+
+# Batches grow toward max_size while calls are fast and succeed, shrink on errors, and failed
+# batches are bisected so only the bad items end up in failed_items instead of the whole batch.
+# Only errors caused by the batch contents are bisected (split=True); provider-side errors such as
+# auth, balance, 429, 5xx or timeouts retry the whole batch, since splitting only multiplies paid
+# requests. A long error streak pauses the run; max_pauses pauses in a row without a single
+# success mean the provider is down, so the run stops and everything left ends up in failed_items.
+class AdaptiveBatcher:
+    def __init__(self, items, max_size, initial_size=None, min_size=1, target_latency=30.0,
+                 grow_factor=2, max_attempts=3, max_consecutive_errors=6, max_pauses=3, pause_factor=12):
+        self.max_size = max_size
+        self.min_size = min(min_size, max_size)
+        self.initial_size = min(initial_size or max_size, max_size)
+        self.size = self.initial_size
+        self.target_latency = target_latency
+        self.grow_factor = grow_factor
+        self.max_attempts = max_attempts
+        self.max_consecutive_errors = max_consecutive_errors
+        self.max_pauses = max_pauses
+        self.pause_factor = pause_factor
+        self.total = len(items)
+        self.done = 0
+        self.batches = 0
+        self.consecutive_errors = 0
+        self.pauses = 0
+        self.abandoned_items = 0
+        self.failed_items = []
+        self._items = list(items)
+        self._next = 0
+        self._retry = deque()
+        self._latency = None
+        self._paused = False
+
+    def __bool__(self):
+        return bool(self._retry) or self._next < len(self._items)
+
+    @property
+    def progress(self):
+        return self.done / self.total if self.total else 1.0
+
+    def next_batch(self):
+        # Split halves of failed batches go first, then fresh items at the current size
+        if self._retry:
+            return self._retry.popleft()
+        batch = self._items[self._next:self._next + self.size]
+        self._next += len(batch)
+        return batch, 1
+
+    def record_success(self, batch, latency):
+        self.batches += 1
+        self.done += len(batch)
+        self.consecutive_errors = 0
+        self.pauses = 0
+        self._latency = latency if self._latency is None else 0.7 * self._latency + 0.3 * latency
+        if self._latency <= self.target_latency:
+            self.size = min(self.max_size, self.size * self.grow_factor)
+        elif latency > 2 * self.target_latency:
+            self.size = max(self.min_size, self.size // 2)
+
+    def record_failure(self, batch, attempt, split=True):
+        self.batches += 1
+        self.consecutive_errors += 1
+        self.size = max(self.min_size, self.size // 2)
+        if self.consecutive_errors >= self.max_consecutive_errors:
+            self._pause(batch, attempt)
+        elif not split:
+            self._retry.appendleft((batch, attempt))
+        elif len(batch) > 1:
+            # Halves queue breadth-first, so a healthy sibling resets the error streak
+            middle = len(batch) // 2
+            self._retry.extend([(batch[:middle], 1), (batch[middle:], 1)])
+        elif attempt < self.max_attempts:
+            self._retry.append((batch, attempt + 1))
+        else:
+            self.done += len(batch)
+            self.failed_items.extend(batch)
+
+    def backoff(self, base):
+        if self._paused:
+            self._paused = False
+            return base * self.pause_factor
+        return base * (2 ** (min(self.consecutive_errors, 3) - 1)) if self.consecutive_errors else 0
+
+    def stop(self, batch=()):
+        # Gives up on the run: the batch in hand, queued halves and unsent items all fail
+        left = list(batch) + [item for pending, _ in self._retry for item in pending] + self._items[self._next:]
+        self._retry.clear()
+        self._next = len(self._items)
+        self.abandoned_items += len(left)
+        self.done += len(left)
+        self.failed_items.extend(left)
+
+    def _pause(self, batch, attempt):
+        self.consecutive_errors = 0
+        self.pauses += 1
+        if self.pauses > self.max_pauses:
+            # No success through several pauses: the provider is down, not this batch
+            self.stop(batch)
+            return
+        self._paused = True
+        self.size = self.initial_size
+        self._retry.appendleft((batch, attempt))
@@ -0,0 +1,193 @@
+import gzip
+import json
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.json as pa_json
+import requests
+from urllib3.util.request import ACCEPT_ENCODING as SUPPORTED_ENCODINGS
+
+# Only the fields we read from a response; everything else is skipped by the Arrow parser
+MONTHLY_SEARCH = pa.struct([
+    ("year", pa.int64()),
+    ("month", pa.int64()),
+    ("search_volume", pa.int64()),
+])
+RESULT_ENTRY = pa.struct([
+    ("keyword", pa.string()),
+    ("monthly_searches", pa.list_(MONTHLY_SEARCH)),
+])
+TASK = pa.struct([
+    ("status_code", pa.int64()),
+    ("status_message", pa.string()),
+    ("result", pa.list_(RESULT_ENTRY)),
+])
+RESPONSE_SCHEMA = pa.schema([
+    ("tasks", pa.list_(TASK)),
+])
+
+# Task status codes for invalid request data (e.g. 40501 Invalid Field), i.e. caused by the keywords sent
+BATCH_ERROR_CODES = range(40500, 40600)
+
+# Batches keep growing while the EWMA of request latency (seconds) stays under this
+TARGET_LATENCY = 20.0
+
+# Brotli comes first, it is noticeably smaller than gzip on these repetitive payloads. urllib3 only
+# lists br when a brotli decoder is installed, otherwise the body would come back undecoded
+ACCEPT_ENCODING = ", ".join(
+    encoding for encoding in ("br", "gzip") if encoding in SUPPORTED_ENCODINGS.split(",")
+)
+
+
+class TaskError(Exception):
+    # The request went through but DataForSEO rejected the task itself
+    def __init__(self, status_code, status_message):
+        super().__init__(f"Task failed with {status_code}: {status_message}")
+        self.status_code = status_code
+
+
+def is_batch_error(error):
+    # Only these are worth bisecting; HTTP errors, timeouts and other task codes are provider-side
+    return isinstance(error, TaskError) and error.status_code in BATCH_ERROR_CODES
+
+
+def build_payload(keywords, location_code, language_code, date_from, date_to, sort_by, include_adult_keywords):
+    return [{
+        "date_from": date_from,
+        "date_to": date_to,
+        "keywords": keywords,
+        "location_code": location_code,
+        "language_code": language_code,
+        "sort_by": sort_by,
+        "include_adult_keywords": include_adult_keywords
+    }]
+
+
+def new_stats():
+    return {"keywords": 0, "request_bytes": 0, "response_bytes": 0, "decoded_bytes": 0, "parse_seconds": 0.0}
+
+
+def merge_stats(total, stats):
+    for key, value in stats.items():
+        total[key] += value
+    return total
+
+
+def format_stats(stats):
+    keywords = max(stats["keywords"], 1)
+    ratio = stats["decoded_bytes"] / max(stats["response_bytes"], 1)
+    return (
+        f"📦 {stats['request_bytes'] / keywords:,.0f} B sent and {stats['response_bytes'] / keywords:,.0f} B received per keyword "
+        f"({ratio:.1f}x compression) · 🧮 {stats['parse_seconds'] * 1000 / keywords:.3f} ms parse CPU per keyword"
+    )
+
+
+def parse_response(body):
+    # A single (possibly pretty-printed) JSON document parsed in C++ against RESPONSE_SCHEMA
+    read_options = pa_json.ReadOptions(block_size=len(body) + 1, use_threads=False)
+    parse_options = pa_json.ParseOptions(
+        explicit_schema=RESPONSE_SCHEMA,
+        newlines_in_values=True,
+        unexpected_field_behavior="ignore",
+    )
+    try:
+        table = pa_json.read_json(pa.BufferReader(body), read_options=read_options, parse_options=parse_options)
+        tasks = table.column("tasks").combine_chunks().flatten()
+    except pa.ArrowInvalid:
+        tasks = pa.array(json.loads(body)["tasks"], type=TASK)
+    if len(tasks) == 0 or not tasks.is_valid()[0].as_py():
+        return None
+    fields = tasks.flatten()
+    status_code = fields[TASK.get_field_index("status_code")][0].as_py()
+    if status_code is not None and status_code != 20000:
+        raise TaskError(status_code, fields[TASK.get_field_index("status_message")][0].as_py())
+    # Arrow array of result entries, only keyword and monthly_searches are materialised
+    return fields[TASK.get_field_index("result")][0].values
+
+
+def fetch_results(url, headers, payload, timeout=30, compress_request=False, stats=None):
+    body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    headers = {**headers, "Accept-Encoding": ACCEPT_ENCODING}
+    if compress_request:
+        body = gzip.compress(body)
+        headers["Content-Encoding"] = "gzip"
+
+    response = requests.post(url, headers=headers, data=body, timeout=timeout, stream=True)
+    response.raise_for_status()
+    content = response.raw.read(decode_content=True)
+    wire_bytes = response.raw.tell()
+
+    # Thread CPU time: the Streamlit server runs other sessions in the same process
+    parse_start = time.thread_time()
+    results = parse_response(content)
+    parse_seconds = time.thread_time() - parse_start
+
+    if stats is not None:
+        stats["keywords"] += len(payload[0]["keywords"])
+        stats["request_bytes"] += len(body)
+        stats["response_bytes"] += wire_bytes
+        stats["decoded_bytes"] += len(content)
+        stats["parse_seconds"] += parse_seconds
+
+    if not results:
+        raise ValueError("Empty result from API")
+    return results
+
+
+def parse_results(results, param, category):
+    # Works column-wise on the Arrow entries instead of one dict per month
+    entries = results.flatten()
+    keywords = entries[RESULT_ENTRY.get_field_index("keyword")].to_pylist()
+    monthly = entries[RESULT_ENTRY.get_field_index("monthly_searches")]
+    lengths = pc.fill_null(pc.list_value_length(monthly), 0).to_pylist()
+    months = monthly.flatten().flatten()
+    years = months[MONTHLY_SEARCH.get_field_index("year")].to_pylist()
+    month_numbers = months[MONTHLY_SEARCH.get_field_index("month")].to_pylist()
+    volumes = months[MONTHLY_SEARCH.get_field_index("search_volume")].to_pylist()
+    columns = [f"{str(month).zfill(2)}-{year}" for month, year in zip(month_numbers, years)]
+
+    rows = []
+    start = 0
+    for keyword, length in zip(keywords, lengths):
+        row = {
+            "Category": category,
+            "Language": param["target_language"],
+            "Region": param["region"],
+            "Country": param["target_location"],
+            "Keyword": keyword
+            }
+
+        if length:
+            end = start + length
+            row.update(zip(columns[start:end], volumes[start:end]))
+            row["Total Volume"] = int(sum(volumes[start:end]))
+            start = end
+
+        else:
+            row["Total Volume"] = None
+
+        rows.append(row)
+    return rows
+
+
+def format_volumes(df_volumes):
+    description_cols = ["Category", "Language", "Region", "Country", "Language", "Total Volume", "Keyword"]
+    date_cols = sorted(
+        [col for col in df_volumes.columns if col not in description_cols],
+        key=lambda x: pd.to_datetime(x, format="%m-%Y")
+    )
+    df_volumes = df_volumes[description_cols + date_cols]
+    df_volumes = df_volumes.sort_values("Total Volume", ascending=False)
+
+    # Add the yearly rolling windows
+    latest_date = df_volumes.columns[-1]
+    latest_month = pd.to_datetime(latest_date, format="%m-%Y").strftime("%b")
+    latest_year = pd.to_datetime(latest_date, format="%m-%Y").strftime("%y")
+    first_month_col_name = df_volumes.select_dtypes("number").columns[1]
+    idx = df_volumes.columns.get_loc(first_month_col_name)
+    for i in range(3, -1, -1):
+        df_volumes[f"12M to {latest_month} {int(latest_year)-i}"] = df_volumes.iloc[:, idx:idx + 12].sum(axis=1)
+        idx += 12
+    return df_volumes
@@ -8,9 +8,15 @@ import base64
 import datetime as dt
 from dotenv import load_dotenv
 from io import BytesIO
-import random
 import yaml
 from zoneinfo import ZoneInfo
+import warehouse
+import scheduler
+import dataforseo
+import process_jobs
+from batching import AdaptiveBatcher
+from preview import TopKeywords
+from collections import Counter, defaultdict
 
 if "logged_in" not in st.session_state or not st.session_state.logged_in:
     st.error("🚫 You must be logged in to access this page.")
@@ -120,6 +126,10 @@ if balance is not None:
 else:
     st.sidebar.error("Couldn't fetch balance.")
 
+st.sidebar.markdown("### 🚦 API Queue")
+queue_state = scheduler.get_scheduler("dataforseo").snapshot()
+st.sidebar.caption(f"{queue_state['active']} running on this host (sharded runs included), {queue_state['queued']} waiting in this server")
+
 API = st.radio("API Mode", ["SANDBOX", "PAID"])
 TOOL_TYPE = st.radio("Choose Tool:", ["Historical Volumes", "Keyword Ideas"])
 CATEGORY = st.text_input("Category Label (for export file)")
@@ -140,6 +150,9 @@ selected = st.data_editor(
 
 SORT = st.radio("Sort Results By", ["search_volume", "relevance"])
 ADULT_KWS = st.checkbox("Include Adult Keywords", value=True)
+COMPRESS_REQUESTS = st.checkbox("Gzip request payloads", value=False, help="Responses are always negotiated as brotli/gzip, this also compresses what we send")
+EXECUTION = st.radio("Execution Mode", ["Sequential", "Sharded"], help="Sharded splits the job by location × keyword range and runs the shards in worker processes")
+WORKERS = st.slider("Worker Processes", min_value=1, max_value=os.cpu_count() or 1, value=min(4, os.cpu_count() or 1)) if EXECUTION == "Sharded" else 1
 
 # --- LOCATIONS ---
 
@@ -180,6 +193,7 @@ if uploaded_file:
         # --- ENV + AUTH ---
         # load_dotenv()
         start = dt.datetime.now()
+        run_timestamp = dt.datetime.now(ZoneInfo("Europe/Bratislava")).strftime("%d-%m-%Y %H-%M-%S")
         login = os.getenv("DATAFORSEO_LOGIN")
         password = os.getenv("DATAFORSEO_PASSWORD")
         auth_string = f"{login}:{password}"
@@ -208,128 +222,203 @@ if uploaded_file:
             "Authorization": f"Basic {auth_encoded}",
             "Content-Type": "application/json"
         }
-        all_rows = []
-        failed_batches = []
-        # --- PROCESSING ---
-        for param in params:
+        failed_terms = []
+        transfer_stats = dataforseo.new_stats()
+        batch_size = 1000 if TOOL_TYPE == "Historical Volumes" else 20
+        targets = []
+        for index, param in enumerate(params):
             if param["target_location"] is None:
                 continue
-            st.badge(param["target_location"])
-            location = int(df_locations.loc[df_locations["location_name"] == param["target_location"], "location_code"].values[0])
-            location_code = df_locations.loc[df_locations["location_name"] == param["target_location"], "country_iso_code"].values[0]
-
-            batch_size = 1000 if TOOL_TYPE == "Historical Volumes" else 20
-            
-            total_batches = len(keywords_list) // batch_size + (1 if len(keywords_list) % batch_size != 0 else 0)
+            targets.append({
+                "index": index,
+                "param": param,
+                "location_code": int(df_locations.loc[df_locations["location_name"] == param["target_location"], "location_code"].values[0]),
+                "language_code": language_dict[param["target_language"]],
+            })
+
+        # --- LIVE PREVIEW ---
+        st.markdown("#### 👀 Live Preview")
+        preview_text = st.empty()
+        preview_table = st.empty()
+        partial_exports = st.container()
+        top_keywords = TopKeywords(columns=["Country", "Language", "Keyword", "Total Volume"])
+
+        def refresh_preview():
+            if top_keywords.changed:
+                preview_text.caption(f"Top {top_keywords.size} of {top_keywords.seen:,} keywords so far by total volume")
+                preview_table.dataframe(top_keywords.to_frame(), use_container_width=True, hide_index=True)
+
+        def export_location(target, df_location):
+            # Offered as soon as a location finishes; on_click="ignore" keeps the run going when clicked
+            param = target["param"]
+            location = f"{param['target_location']} - {param['target_language']}"
+            try:
+                df_location = dataforseo.format_volumes(df_location)
+            except Exception as e:
+                partial_exports.warning(f"Couldn't prepare the partial export for {location}: {e}")
+                return
+            buffer = BytesIO()
+            df_location.to_excel(buffer, index=False, engine="openpyxl")
+            partial_exports.download_button(
+                f"📥 Download {location} ({len(df_location):,} keywords)",
+                buffer.getvalue(),
+                file_name=f"SEARCH VOLUMES - {CATEGORY} - {location} - {run_timestamp}.xlsx",
+                key=f"partial_export_{target['index']}",
+                on_click="ignore",
+            )
 
+        # --- PROCESSING ---
+        if EXECUTION == "Sharded":
+            shards = process_jobs.plan_shards(
+                targets,
+                keywords_list,
+                batch_size,
+                url=url,
+                headers=headers,
+                date_from=DATE_FROM,
+                date_to=DATE_TO,
+                sort_by=SORT,
+                include_adult_keywords=ADULT_KWS,
+                category=CATEGORY,
+                compress_request=COMPRESS_REQUESTS,
+            )
             progress_bar = st.progress(0)
             status_text = st.empty()
-            batch_num = 0
-            
-            with st.spinner("⏳ Processing..."):
-                for i in range(0, len(keywords_list), batch_size):
-                    batch = keywords_list[i:i + batch_size]
-                    payload_dict = [{
-                        "date_from": DATE_FROM,
-                        "date_to": DATE_TO,
-                        "keywords": batch,
-                        "location_code": location,
-                        "language_code": language_dict[param["target_language"]],
-                        "sort_by": SORT,
-                        "include_adult_keywords": ADULT_KWS
-                    }]
-
-                    retries = 0
-                    success = False
-
-                    while not success and retries < 3:
+            shards_done = []
+            # Grouped by target row, the same location can be listed more than once
+            shards_left = Counter(shard["index"] for shard in shards)
+            location_tables = defaultdict(list)
+
+            def on_shard_done(shard, table, errors, abandoned):
+                shards_done.append(shard)
+                index = shard["index"]
+                location = shard["param"]["target_location"]
+                for error in errors:
+                    st.warning(f"❌ Shard {shard['id'] + 1} ({location}): {error}")
+                if abandoned:
+                    st.error(f"DataForSEO kept failing, shard {shard['id'] + 1} ({location}) gave up on {abandoned:,} keywords.")
+                if table.num_rows:
+                    location_tables[index].append(table)
+                    for row in table.select(top_keywords.columns).to_pylist():
+                        top_keywords.push(row["Total Volume"], row)
+                    refresh_preview()
+                shards_left[index] -= 1
+                if shards_left[index] == 0 and location_tables[index]:
+                    location_table = process_jobs.merge_shards(location_tables.pop(index))
+                    export_location(shard, location_table.to_pandas())
+                progress = len(shards_done) / len(shards)
+                progress_bar.progress(progress)
+                status_text.markdown(f"""
+                <b>🧩 Shard {len(shards_done)} of {len(shards)} ({location})</b>  
+                <b>✅ Progress: {int(progress * 100)}%</b>
+                """, unsafe_allow_html=True)
+
+            with st.spinner(f"⏳ Processing {len(shards)} shards on {WORKERS} workers..."):
+                merged, failed_terms, transfer_stats = process_jobs.run_sharded(
+                    shards,
+                    WORKERS,
+                    on_done=on_shard_done,
+                )
+            df_volumes = merged.to_pandas()
+        else:
+            all_rows = []
+            for position, target in enumerate(targets):
+                param = target["param"]
+                location_start = len(all_rows)
+                st.badge(param["target_location"])
+
+                batcher = AdaptiveBatcher(keywords_list, max_size=batch_size, target_latency=dataforseo.TARGET_LATENCY)
+
+                progress_bar = st.progress(0)
+                status_text = st.empty()
+                queue_text = st.empty()
+
+                with st.spinner("⏳ Processing..."):
+                    while batcher:
+                        batch, attempt = batcher.next_batch()
+                        payload_dict = dataforseo.build_payload(
+                            batch,
+                            target["location_code"],
+                            target["language_code"],
+                            DATE_FROM,
+                            DATE_TO,
+                            SORT,
+                            ADULT_KWS
+                        )
+
                         try:
-                            response = requests.post(url, headers=headers, data=json.dumps(payload_dict), timeout=30)
-                            response.raise_for_status()
-                            response_json = response.json()
-
-                            results = response_json["tasks"][0].get("result")
-                            if not results:
-                                raise ValueError("Empty result from API")
-                            
-                            for entry in results:
-                                keyword = entry["keyword"]
-                                monthly_data = entry.get("monthly_searches", [])
-                                row = {
-                                    "Category": CATEGORY,
-                                    "Language": param["target_language"],
-                                    "Region": param["region"],
-                                    "Country": param["target_location"], 
-                                    "Keyword": keyword
-                                    }
-                                
-                                if monthly_data:
-                                    total_volume = 0
-                                    for month_entry in monthly_data:
-                                        month = str(month_entry["month"]).zfill(2)
-                                        year = str(month_entry["year"])
-                                        column_name = f"{month}-{year}"
-                                        row[column_name] = int(month_entry["search_volume"])
-                                        total_volume += int(month_entry["search_volume"])
-                                    row["Total Volume"] = int(total_volume)
-                                    
-                                else:
-                                    row["Total Volume"] = pd.NA
-
-                                all_rows.append(row)
-
-                            success = True
+                            with scheduler.slot(
+                                "dataforseo",
+                                st.session_state.user,
+                                on_wait=lambda position, queued: queue_text.caption(f"🚦 Queue position {position} of {queued}"),
+                            ):
+                                queue_text.empty()
+                                request_start = time.perf_counter()
+                                results = dataforseo.fetch_results(
+                                    url, headers, payload_dict, compress_request=COMPRESS_REQUESTS, stats=transfer_stats
+                                )
+                                latency = time.perf_counter() - request_start
+                            rows = dataforseo.parse_results(results, param, CATEGORY)
+                            all_rows.extend(rows)
+                            batcher.record_success(batch, latency)
+                            for row in rows:
+                                top_keywords.push(row["Total Volume"], row)
+                            refresh_preview()
                         except Exception as e:
-                            retries += 1
-                            wait = 5 * (2 ** (retries - 1))
-                            st.warning(f"❌ Error in batch {i // batch_size + 1}: {e} — retrying in {wait}s...")
+                            split = dataforseo.is_batch_error(e)
+                            batcher.record_failure(batch, attempt, split=split)
+                            wait = batcher.backoff(5)
+                            retry = "in smaller batches" if split else "the same batch"
+                            st.warning(f"❌ Error in a batch of {len(batch)} keywords: {e} — retrying {retry} in {wait}s...")
                             time.sleep(wait)
 
-                    if not success:
-                        failed_batches.append(i)
-
-                    batch_num += 1
-                    progress = batch_num / total_batches
-                    progress_bar.progress(progress)
-                    status_text.markdown(f"""
-                    <b>📦 Batch {batch_num} of {total_batches}</b>  
-                    <b>✅ Progress: {int(progress * 100)}%</b>
-                    """, unsafe_allow_html=True)
-                    time.sleep(5.1 + random.uniform(0.5, 1.5))
+                        progress_bar.progress(batcher.progress)
+                        status_text.markdown(f"""
+                        <b>📦 Batch {batcher.batches} · next batch size {batcher.size}</b>  
+                        <b>✅ Progress: {int(batcher.progress * 100)}%</b>
+                        """, unsafe_allow_html=True)
+
+                failed_terms.extend((param["target_location"], term) for term in batcher.failed_items)
+                if len(all_rows) > location_start:
+                    export_location(target, pd.DataFrame(all_rows[location_start:]))
+                if batcher.abandoned_items:
+                    # The provider is down, the remaining locations would only fail the same way
+                    skipped = targets[position + 1:]
+                    failed_terms.extend((t["param"]["target_location"], term) for t in skipped for term in keywords_list)
+                    st.error(
+                        f"DataForSEO kept failing, stopped the run with {batcher.abandoned_items:,} keywords left "
+                        f"for {param['target_location']} and {len(skipped)} locations not started."
+                    )
+                    break
+            df_volumes = pd.DataFrame(all_rows)
 
         # --- FINALIZE ---
-        df_volumes = pd.DataFrame(all_rows)
-        description_cols = ["Category", "Language", "Region", "Country", "Language", "Total Volume", "Keyword"]
-        date_cols = sorted(
-            [col for col in df_volumes.columns if col not in description_cols],
-            key=lambda x: pd.to_datetime(x, format="%m-%Y")
-        )
-        df_volumes = df_volumes[description_cols + date_cols]
-        df_volumes = df_volumes.sort_values("Total Volume", ascending=False)
-
-        # Add the yearly rolling windows
-        latest_date = df_volumes.columns[-1]
-        latest_month = pd.to_datetime(latest_date, format="%m-%Y").strftime("%b")
-        latest_year = pd.to_datetime(latest_date, format="%m-%Y").strftime("%y")
-        first_month_col_name = df_volumes.select_dtypes("number").columns[1]
-        idx = df_volumes.columns.get_loc(first_month_col_name)
-        for i in range(3, -1, -1):
-            df_volumes[f"12M to {latest_month} {int(latest_year)-i}"] = df_volumes.iloc[:, idx:idx + 12].sum(axis=1)
-            idx += 12
+        try:
+            stored = warehouse.append_volumes(df_volumes, source="dataforseo")
+            st.info(f"🗄️ Stored {stored:,} monthly data points in the volume warehouse.")
+        except Exception as e:
+            st.warning(f"Failed to store results in the volume warehouse: {e}")
+        df_volumes = dataforseo.format_volumes(df_volumes)
 
         # --- EXPORT ---
         local_now = dt.datetime.now(ZoneInfo("Europe/Bratislava"))
         timestamp = local_now.strftime("%d-%m-%Y %H-%M-%S")
         filename = f"SEARCH VOLUMES - {CATEGORY} - {timestamp}.xlsx"
+        df_failed_terms = pd.DataFrame(failed_terms, columns=["Country", "Keyword"])
         buffer = BytesIO()
-        df_volumes.to_excel(buffer, index=False, engine="openpyxl")
+        with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
+            df_volumes.to_excel(writer, index=False, sheet_name="data")
+            if not df_failed_terms.empty:
+                df_failed_terms.to_excel(writer, index=False, sheet_name="failed_terms")
         end = dt.datetime.now()
         duration = (end - start).total_seconds() / 60
         st.success(f"Process done in {duration:.2f} minutes")
+        st.caption(dataforseo.format_stats(transfer_stats))
         st.success("✅ Done! Download your Excel file below:")
         st.download_button("📥 Download Excel", buffer.getvalue(), file_name=filename)
 
-        if failed_batches:
-            st.warning(f"⚠️ Some batches failed: {failed_batches}")
+        if failed_terms:
+            st.warning(f"⚠️ {len(failed_terms)} keywords failed, see the failed_terms sheet:")
+            st.dataframe(df_failed_terms.head(100), use_container_width=True, hide_index=True)
         else:
             st.info("✅ All batches processed successfully!")
@@ -5,6 +5,8 @@ import time
 import streamlit as st
 from io import BytesIO
 import pandas as pd
+import scheduler
+from batching import AdaptiveBatcher
 
 if "logged_in" not in st.session_state or not st.session_state.logged_in:
     st.error("🚫 You must be logged in to access this page.")
@@ -36,34 +38,33 @@ DEEPL_API_KEY = st.secrets["DEEPL_API_KEY"]
 # DeepL API URL for translation
 DEEPL_API_URL = 'https://api.deepl.com/v2/translate'  # Use 'api.deepl.com' for paid accounts
 
-# Function to translate text in batches using DeepL API
-def translate_batch(texts, target_language=TARGET_LANGUAGE, retries=3):
-    attempt = 0
-    while attempt < retries:
-        try:
-            data = {
-                'auth_key': DEEPL_API_KEY,
-                'text': texts,  # Pass the batch of texts as an array
-                'source_lang': ORIGINAL_LANGUAGE,
-                'target_lang': target_language
-            }
-            response = requests.post(DEEPL_API_URL, data=data)
-            response.raise_for_status()  # Raise an exception if the request was unsuccessful
-            result = response.json()
-            translations = [translation['text'] for translation in result['translations']]  # Extract the translations
-            return translations  # If successful, return the translations and exit
-        except requests.exceptions.RequestException as e:
-            print(f"Request error during batch translation (attempt {attempt + 1}): {e}")
-            time.sleep(2 ** attempt)  # Exponential backoff
-        except KeyError:
-            print(f"Unexpected response format during batch translation (attempt {attempt + 1}): {response.text}")
-            time.sleep(2 ** attempt)
-
-        attempt += 1  # Increment the attempt counter
-
-    # If all retries fail
-    print("Batch translation failed after all retry attempts.")
-    return [None] * len(texts)
+# Function to translate one batch of texts using DeepL API, retries are left to the AdaptiveBatcher
+def translate_batch(texts, target_language=TARGET_LANGUAGE):
+    data = {
+        'auth_key': DEEPL_API_KEY,
+        'text': texts,  # Pass the batch of texts as an array
+        'source_lang': ORIGINAL_LANGUAGE,
+        'target_lang': target_language
+    }
+    with scheduler.slot(
+        "deepl",
+        st.session_state.user,
+        on_wait=lambda position, queued: queue_text.caption(f"🚦 Queue position {position} of {queued}"),
+    ):
+        queue_text.empty()
+        response = requests.post(DEEPL_API_URL, data=data)
+    response.raise_for_status()  # Raise an exception if the request was unsuccessful
+    result = response.json()
+    try:
+        return [translation['text'] for translation in result['translations']]  # Extract the translations
+    except KeyError:
+        raise ValueError(f"Unexpected response format during batch translation: {response.text}")
+
+def is_batch_error(error):
+    # A rejected or oversized request points at the texts; auth, quota (456), 429, 5xx and timeouts do not
+    response = getattr(error, "response", None)
+    return response is not None and response.status_code in (400, 413)
+
 # Load the Excel file
 if FILE_TO_TRANSLATE:
     keywords = pd.read_excel(FILE_TO_TRANSLATE, header=0)
@@ -78,44 +79,45 @@ if FILE_TO_TRANSLATE:
 
     # Collect texts from the specified column and track the rows for batch processing
     texts_to_translate = []
-    rows_to_update = []
-    batch_size = 20  # Reduced batch size to mitigate potential API issues
+    max_batch_size = 50  # DeepL accepts up to 50 texts per request
+    initial_batch_size = 20  # Start small and let the batcher grow while DeepL responds well
 
 if st.button("Translate"):
+    queue_text = st.empty()
+    progress_bar = st.progress(0)
     # Loop through each row in the specified column
     for row in ws.iter_rows(min_row=ROW_TO_START_FROM, min_col=COLUMN_TO_BE_TRANSLATED, max_col=COLUMN_TO_BE_TRANSLATED):
         search_query = row[0].value  # Accessing value in the column
         current_row = row[0].row
 
-        if search_query:
-            # Check if the corresponding cell in the target column is empty
-            if not ws.cell(row=current_row, column=starting_column).value:
-                texts_to_translate.append(search_query)
-                rows_to_update.append(current_row)
-
-            # When the batch is full, send it for translation
-            if len(texts_to_translate) >= batch_size:
-                translations = translate_batch(texts_to_translate, target_language=TARGET_LANGUAGE)
-
-                # Write the translations back into the target column
-                for i, translation in enumerate(translations):
-                    if translation is not None:
-                        ws.cell(row=rows_to_update[i], column=starting_column, value=translation)
-                    else:
-                        print(f"Translation failed for row {rows_to_update[i]}: {texts_to_translate[i]}")
-
-                # Clear the batch lists
-                texts_to_translate.clear()
-                rows_to_update.clear()
-
-    # If there are any remaining texts to be translated (less than the batch size)
-    if texts_to_translate:
-        translations = translate_batch(texts_to_translate, target_language=TARGET_LANGUAGE)
-        for i, translation in enumerate(translations):
-            if translation is not None:
-                ws.cell(row=rows_to_update[i], column=starting_column, value=translation)
-            else:
-                print(f"Translation failed for row {rows_to_update[i]}: {texts_to_translate[i]}")
+        # Check if the corresponding cell in the target column is empty
+        if search_query and not ws.cell(row=current_row, column=starting_column).value:
+            texts_to_translate.append((current_row, search_query))
+
+    batcher = AdaptiveBatcher(texts_to_translate, max_size=max_batch_size, initial_size=initial_batch_size, target_latency=5.0)
+    while batcher:
+        batch, attempt = batcher.next_batch()
+        try:
+            request_start = time.perf_counter()
+            translations = translate_batch([text for _, text in batch], target_language=TARGET_LANGUAGE)
+            batcher.record_success(batch, time.perf_counter() - request_start)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"Error during batch translation of {len(batch)} texts (attempt {attempt}): {e}")
+            batcher.record_failure(batch, attempt, split=is_batch_error(e))
+            time.sleep(batcher.backoff(1))  # Exponential backoff
+            continue
+
+        # Write the translations back into the target column
+        for (current_row, _), translation in zip(batch, translations):
+            ws.cell(row=current_row, column=starting_column, value=translation)
+        progress_bar.progress(batcher.progress)
+
+    for current_row, text in batcher.failed_items:
+        print(f"Translation failed for row {current_row}: {text}")
+    if batcher.abandoned_items:
+        st.error(f"DeepL kept failing, stopped with {batcher.abandoned_items} keywords left untranslated.")
+    elif batcher.failed_items:
+        st.warning(f"⚠️ {len(batcher.failed_items)} keywords could not be translated and were left empty.")
 
     # Save the changes to the Excel file
     filename = f'translated_file_{ORIGINAL_LANGUAGE + "_" + str(TIME)}.xlsx'
@@ -1,6 +1,7 @@
 import pandas as pd
 from google.ads.googleads.client import GoogleAdsClient
 from google.ads.googleads.errors import GoogleAdsException
+import grpc
 import yaml
 import streamlit as st
 import json
@@ -9,6 +10,10 @@ import datetime as dt
 import time
 import os
 from zoneinfo import ZoneInfo
+import warehouse
+import scheduler
+from batching import AdaptiveBatcher
+from preview import TopKeywords
 
 config = {
     "developer_token": st.secrets["developer_token"],
@@ -30,6 +35,9 @@ st.title("🔑 Monthly Access Tool")
 with st.sidebar:
     st.markdown("## 👤 Profile")
     st.text_input("User", value=st.session_state.user, key="user_display", disabled=True)
+    st.markdown("### 🚦 API Queue")
+    queue_state = scheduler.get_scheduler("google_ads").snapshot()
+    st.caption(f"{queue_state['active']} running on this host, {queue_state['queued']} waiting in this server")
 
 with open("locations.json", "r", encoding="utf-8") as f:
     locations = json.load(f)
@@ -108,12 +116,20 @@ if uploaded_file:
 
     if st.button("🚀 Run Volume Script" if tool_type == "Historical Volumes" else "🚀 Get Keyword Ideas"):
         start = dt.datetime.now()
+        run_timestamp = dt.datetime.now(ZoneInfo("Europe/Bratislava")).strftime("%d-%m-%Y %H-%M-%S")
         # ✅ Moved client outside loop
         client = GoogleAdsClient.load_from_dict(config)
         googleads_service = client.get_service("GoogleAdsService")
         keyword_plan_idea_service = client.get_service("KeywordPlanIdeaService")
 
-        for param in params:
+        # --- LIVE PREVIEW ---
+        st.markdown("#### 👀 Live Preview")
+        preview_text = st.empty()
+        preview_table = st.empty()
+        partial_exports = st.container()
+        top_keywords = TopKeywords()
+
+        for index, param in enumerate(params):
             if param["target_location"] is None:
                 continue
 
@@ -123,14 +139,14 @@ if uploaded_file:
 
             batch_size = 10000 if tool_type == "Historical Volumes" else 20
             all_rows, failed_terms = [], []
+            batcher = AdaptiveBatcher(keywords_list, max_size=batch_size, target_latency=30.0)
             progress_bar = st.progress(0)
             status_text = st.empty()
-            batch_num = 0
-            total_batches = len(keywords_list) // batch_size + (1 if len(keywords_list) % batch_size != 0 else 0)
+            queue_text = st.empty()
 
             with st.spinner("⏳ Processing..."):
-                for i in range(0, len(keywords_list), batch_size):
-                    batch = keywords_list[i:i + batch_size]
+                while batcher:
+                    batch, attempt = batcher.next_batch()
 
                     request = client.get_type(client_type)
                     request.customer_id = config["customer_id"]
@@ -153,7 +169,15 @@ if uploaded_file:
                             else keyword_plan_idea_service.generate_keyword_ideas
                         )
 
-                        response = request_method(request=request, timeout=90)
+                        with scheduler.slot(
+                            "google_ads",
+                            st.session_state.user,
+                            on_wait=lambda position, queued: queue_text.caption(f"🚦 Queue position {position} of {queued}"),
+                        ):
+                            queue_text.empty()
+                            request_start = time.perf_counter()
+                            response = request_method(request=request, timeout=90)
+                            latency = time.perf_counter() - request_start
                         results = []
                         for result in response.results:
                             metrics = result.keyword_metrics if tool_type == "Historical Volumes" else result.keyword_idea_metrics
@@ -169,21 +193,36 @@ if uploaded_file:
                                 col = f"{month}-{record.year}"
                                 row[col] = record.monthly_searches
                             all_rows.append(row)
+                            volume = sum(v for k, v in row.items() if k != "Keyword")
+                            top_keywords.push(volume, {
+                                "Country": param["target_location"],
+                                "Language": param["target_language"],
+                                "Keyword": row["Keyword"],
+                                "Volume": volume,
+                            })
+                        batcher.record_success(batch, latency)
+                        if top_keywords.changed:
+                            preview_text.caption(f"Top {top_keywords.size} of {top_keywords.seen:,} keywords so far by volume")
+                            preview_table.dataframe(top_keywords.to_frame(), use_container_width=True, hide_index=True)
 
                     except GoogleAdsException as e:
-                        st.error(f"Google Ads API error: {e}")
-                        st.stop()
-
-                    batch_num += 1
-                    progress = batch_num / total_batches
-                    progress_bar.progress(progress)
+                        # Only a rejected request points at the keywords; quota, auth and outages do not
+                        split = e.error.code() == grpc.StatusCode.INVALID_ARGUMENT
+                        batcher.record_failure(batch, attempt, split=split)
+                        if batcher.abandoned_items:
+                            st.error(f"Google Ads API error: {e}")
+                            st.stop()
+                        wait = batcher.backoff(5)
+                        retry = "in smaller batches" if split else "the same batch"
+                        st.warning(f"❌ Google Ads API error for a batch of {len(batch)} keywords — retrying {retry} in {wait}s...")
+                        time.sleep(wait)
+
+                    progress_bar.progress(batcher.progress)
                     status_text.markdown(f"""
-                    <b>📦 Batch {batch_num} of {total_batches}</b>  
-                    <b>✅ Progress: {int(progress * 100)}%</b>
+                    <b>📦 Batch {batcher.batches} · next batch size {batcher.size}</b>  
+                    <b>✅ Progress: {int(batcher.progress * 100)}%</b>
                     """, unsafe_allow_html=True)
 
-                    time.sleep(5)
-
             # ✅ Build df only once here
             df = pd.DataFrame(all_rows)
             df["Region"] = param["region"]
@@ -194,6 +233,11 @@ if uploaded_file:
             col_order = description_columns + [c for c in df.columns if c not in description_columns]
             df = df[col_order]
 
+            try:
+                warehouse.append_volumes(df, source="google_ads")
+            except Exception as e:
+                st.warning(f"Failed to store {param['target_location']} in the volume warehouse: {e}")
+
             result_terms = set(df["Keyword"])
             input_terms = set(keywords_list)
             missing_terms = [(param["target_location"], term) for term in input_terms - result_terms]
@@ -221,6 +265,20 @@ if uploaded_file:
             all_data.append(full_df)
             all_failed.append(df_failed_terms)
 
+            # Offered as soon as the location finishes; on_click="ignore" keeps the run going when clicked
+            location = f"{param['target_location']} - {param['target_language']}"
+            location_buffer = BytesIO()
+            with pd.ExcelWriter(location_buffer, engine="openpyxl") as writer:
+                full_df.sort_values(by=rolling_12m_column_name, ascending=False).to_excel(writer, index=False, sheet_name="data")
+                df_failed_terms.to_excel(writer, index=False, sheet_name="failed_terms")
+            partial_exports.download_button(
+                f"📥 Download {location} ({len(full_df):,} keywords)",
+                location_buffer.getvalue(),
+                file_name=f"{'SEARCH VOLUMES' if tool_type == 'Historical Volumes' else 'KEYWORD IDEAS'} - {category} - {location} - {run_timestamp}.xlsx",
+                key=f"partial_export_{index}",
+                on_click="ignore",
+            )
+
         final_data = pd.concat(all_data, axis=0)
         final_failed = pd.concat(all_failed, axis=0)
         buffer = BytesIO()
@@ -0,0 +1,88 @@
+import streamlit as st
+import pandas as pd
+import datetime as dt
+import time
+from io import BytesIO
+from zoneinfo import ZoneInfo
+import warehouse
+
+if "logged_in" not in st.session_state or not st.session_state.logged_in:
+    st.error("🚫 You must be logged in to access this page.")
+    st.stop()
+
+st.set_page_config(page_title="Volume Warehouse", layout="wide")
+st.title("🗄️ Volume Warehouse")
+
+with st.sidebar:
+    st.markdown("## 👤 Profile")
+    st.text_input("User", value=st.session_state.user, key="user_display", disabled=True)
+
+st.markdown("Query search volumes from all past pulls without calling any API.")
+
+
+@st.cache_data(show_spinner=False)
+def load_filter_values(signature):
+    # Keyed on the store's file list, so a new pull invalidates it without rescanning on every rerun
+    return warehouse.distinct_values(["location", "year", "language", "category", "source"])
+
+
+filter_values = load_filter_values(warehouse.files_signature())
+locations = filter_values["location"]
+if not locations:
+    st.info("The warehouse is empty. Run a pull on the Monthly Access or DataForSEO tool first.")
+    st.stop()
+
+years = filter_values["year"]
+
+# --- FILTERS ---
+selected_locations = st.multiselect("Locations", options=locations)
+selected_languages = st.multiselect("Languages", options=filter_values["language"])
+selected_categories = st.multiselect("Categories", options=filter_values["category"])
+selected_sources = st.multiselect("Sources", options=filter_values["source"])
+if len(years) > 1:
+    year_from, year_to = st.slider("Years", min_value=min(years), max_value=max(years), value=(min(years), max(years)))
+else:
+    year_from = year_to = years[0]
+AGGREGATION = st.radio("Aggregate By", ["Monthly", "Yearly", "Total"], horizontal=True)
+LATEST_ONLY = st.checkbox("Keep only the latest pull per keyword and month", value=True)
+uploaded_file = st.file_uploader("📁 Optionally restrict to keywords from an Excel file", type=["xlsx"])
+
+keywords_list = None
+if uploaded_file:
+    try:
+        df_keywords = pd.read_excel(uploaded_file)
+        keywords_list = df_keywords.iloc[:, 0].dropna().tolist()
+        st.success(f"Loaded {len(keywords_list)} keywords.")
+    except Exception as e:
+        st.error(f"Failed to read Excel: {e}")
+        st.stop()
+
+if st.button("🔎 Run Query"):
+    start = time.perf_counter()
+    df = warehouse.query_volumes(
+        keywords=keywords_list,
+        locations=selected_locations,
+        languages=selected_languages,
+        categories=selected_categories,
+        sources=selected_sources,
+        year_from=year_from,
+        year_to=year_to,
+        latest_only=LATEST_ONLY,
+    )
+    result = warehouse.aggregate_volumes(df, AGGREGATION)
+    duration = time.perf_counter() - start
+
+    if result.empty:
+        st.warning("No data matches the selected filters.")
+        st.stop()
+
+    st.success(f"Found {len(result):,} rows from {len(df):,} data points in {duration:.2f} seconds")
+    st.dataframe(result.head(1000), use_container_width=True, hide_index=True)
+
+    # --- EXPORT ---
+    local_now = dt.datetime.now(ZoneInfo("Europe/Bratislava"))
+    timestamp = local_now.strftime("%d-%m-%Y %H-%M-%S")
+    buffer = BytesIO()
+    result.to_excel(buffer, index=False, engine="openpyxl")
+    st.download_button("📥 Download Excel", buffer.getvalue(), file_name=f"WAREHOUSE QUERY - {timestamp}.xlsx")
+    st.download_button("📥 Download CSV", result.to_csv(index=False).encode("utf-8"), file_name=f"WAREHOUSE QUERY - {timestamp}.csv")
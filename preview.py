@@ -0,0 +1,37 @@
+import heapq
+import itertools
+
+import pandas as pd
+
+# How many rows the live preview keeps while a pull is running
+PREVIEW_SIZE = 100
+
+
+# Bounded min-heap of the highest-volume rows seen so far, memory stays at `size` rows however big the pull
+class TopKeywords:
+    def __init__(self, size=PREVIEW_SIZE, columns=None):
+        self.size = size
+        self.columns = columns
+        self.seen = 0
+        self.changed = False
+        self._heap = []
+        self._order = itertools.count()
+
+    def push(self, volume, row):
+        self.seen += 1
+        if volume is None or pd.isna(volume):
+            return
+        if self.columns:
+            row = {c: row.get(c) for c in self.columns}
+        # The counter breaks volume ties so rows themselves are never compared
+        item = (volume, next(self._order), row)
+        if len(self._heap) < self.size:
+            heapq.heappush(self._heap, item)
+            self.changed = True
+        elif volume > self._heap[0][0]:
+            heapq.heapreplace(self._heap, item)
+            self.changed = True
+
+    def to_frame(self):
+        self.changed = False
+        return pd.DataFrame([row for _, _, row in sorted(self._heap, key=lambda item: item[:2], reverse=True)])
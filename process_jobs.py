@@ -0,0 +1,132 @@
+import multiprocessing
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import pandas as pd
+import pyarrow as pa
+
+import dataforseo
+import scheduler
+from batching import AdaptiveBatcher
+
+# Batches per shard, kept small so partial results and per-location exports arrive often
+BATCHES_PER_SHARD = 3
+
+
+def plan_shards(targets, keywords, batch_size, **request):
+    # One shard per location x keyword range
+    shards = []
+    shard_size = batch_size * BATCHES_PER_SHARD
+    for target in targets:
+        for offset in range(0, len(keywords), shard_size):
+            shards.append({
+                "id": len(shards),
+                **target,
+                "keywords": keywords[offset:offset + shard_size],
+                "batch_size": batch_size,
+                **request,
+            })
+    return shards
+
+
+def run_shard(shard, cancel=None):
+    # Runs in a worker process: network, JSON parsing and row building all stay off the UI process
+    cancel = cancel if cancel is not None else threading.Event()
+    rows, errors = [], []
+    stats = dataforseo.new_stats()
+    param = shard["param"]
+    batcher = AdaptiveBatcher(shard["keywords"], max_size=shard["batch_size"], target_latency=dataforseo.TARGET_LATENCY)
+    while batcher and not cancel.is_set():
+        batch, attempt = batcher.next_batch()
+        payload = dataforseo.build_payload(
+            batch,
+            shard["location_code"],
+            shard["language_code"],
+            shard["date_from"],
+            shard["date_to"],
+            shard["sort_by"],
+            shard["include_adult_keywords"],
+        )
+        try:
+            # The provider slot is held for this request only, never across backoff sleeps
+            with scheduler.worker_slot("dataforseo"):
+                if cancel.is_set():
+                    # Cancelled while waiting for the slot or pacing, don't spend the request
+                    batcher.stop(batch)
+                    break
+                request_start = time.perf_counter()
+                results = dataforseo.fetch_results(
+                    shard["url"], shard["headers"], payload, compress_request=shard["compress_request"], stats=stats
+                )
+                latency = time.perf_counter() - request_start
+            rows.extend(dataforseo.parse_results(results, param, shard["category"]))
+            batcher.record_success(batch, latency)
+        except Exception as e:
+            errors.append(f"Error in a batch of {len(batch)} keywords: {e}")
+            batcher.record_failure(batch, attempt, split=dataforseo.is_batch_error(e))
+            # Wakes up early when the run is cancelled
+            cancel.wait(batcher.backoff(5))
+    if cancel.is_set():
+        batcher.stop()
+
+    # Rows differ in their month columns (keywords without volume have none), so the schema
+    # has to come from the union of all keys, not from the first row like Table.from_pylist
+    table = pa.Table.from_pandas(pd.DataFrame(rows), preserve_index=False)
+    if table.num_rows:
+        table = table.sort_by([("Total Volume", "descending")])
+    failed_terms = [(param["target_location"], term) for term in batcher.failed_items]
+    # Errors travel back with the result so the UI can show them, workers have no Streamlit context
+    return shard["id"], table, failed_terms, stats, errors, batcher.abandoned_items
+
+
+def merge_shards(tables):
+    # Shards arrive as sorted runs; concatenating and letting Arrow sort merges them in C++
+    tables = [t for t in tables if t.num_rows]
+    if not tables:
+        return pa.table({})
+    # "permissive" also unifies Total Volume typed int64 in one shard and double (with NaN) in another
+    merged = pa.concat_tables(tables, promote_options="permissive")
+    return merged.sort_by([("Total Volume", "descending")])
+
+
+def run_sharded(shards, max_workers, on_done=None):
+    tables, failed_terms = [], []
+    stats = dataforseo.new_stats()
+    pending = {}
+
+    def collect(futures):
+        for future in futures:
+            shard = pending.pop(future)
+            _, table, shard_failed, shard_stats, errors, abandoned = future.result()
+            if abandoned:
+                # The provider is down: every other shard stops and fails what it has left
+                cancel.set()
+            tables.append(table)
+            failed_terms.extend(shard_failed)
+            dataforseo.merge_stats(stats, shard_stats)
+            if on_done:
+                on_done(shard, table, errors, abandoned)
+
+    # Spawned workers never inherit the Streamlit server's threads
+    context = multiprocessing.get_context("spawn")
+    with context.Manager() as manager:
+        cancel = manager.Event()
+        pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=context)
+        try:
+            for shard in shards:
+                if len(pending) >= max_workers:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                pending[pool.submit(run_shard, shard, cancel)] = shard
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+        except BaseException:
+            # A stopped script or a failed shard must not wait for shards still calling the paid API
+            cancel.set()
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        pool.shutdown()
+
+    return merge_shards(tables), failed_terms, stats
@@ -0,0 +1,193 @@
+import fcntl
+import itertools
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+# --- PROVIDER BUDGETS ---
+# Both limits are shared by every process on the host (Streamlit sessions and shard workers)
+# through lock files in RATE_LIMIT_DIR: max_concurrent slot files and one next-start file.
+# Sessions in this server are served fair-share; shard workers take a slot per request and
+# step aside while any session is queued, so interactive pulls never wait behind a sharded
+# run. The trade-off is that a sharded run can be slowed down by a steady stream of sessions.
+PROVIDER_LIMITS = {
+    "dataforseo": {"max_concurrent": 2, "min_interval": 6.0},
+    "google_ads": {"max_concurrent": 1, "min_interval": 5.0},
+    "deepl": {"max_concurrent": 2, "min_interval": 0.5},
+}
+
+# How often a waiting session wakes up to refresh its queue position
+POLL_INTERVAL = 1.0
+
+RATE_LIMIT_DIR = os.getenv("RATE_LIMIT_DIR", os.path.join(tempfile.gettempdir(), "searchabull-rate-limits"))
+
+
+class ProviderScheduler:
+    def __init__(self, name):
+        self.name = name
+        self._cond = threading.Condition()
+        self._waiting = {}
+        self._last_grant = {}
+        self._tickets = itertools.count()
+
+    def _queue(self):
+        # Fair share: the user served least recently goes first, FIFO within a user
+        return sorted(self._waiting, key=lambda t: (self._last_grant.get(self._waiting[t], 0.0), t))
+
+    def _try_grant(self, ticket):
+        queue = self._queue()
+        position = queue.index(ticket) + 1
+        if position == 1:
+            handle = _try_lock_slot(self.name)
+            if handle is not None:
+                user = self._waiting.pop(ticket)
+                self._last_grant[user] = time.monotonic()
+                self._cond.notify_all()
+                return handle, position, len(queue), 0.0
+        return None, position, len(queue), POLL_INTERVAL
+
+    def acquire(self, user, on_wait=None):
+        with self._cond:
+            ticket = next(self._tickets)
+            self._waiting[ticket] = user
+        try:
+            while True:
+                with self._cond:
+                    handle, position, queued, delay = self._try_grant(ticket)
+                if handle is not None:
+                    return handle
+                _mark_session_waiting(self.name)
+                # Report outside the lock so a slow UI update never blocks other sessions
+                if on_wait:
+                    on_wait(position, queued)
+                with self._cond:
+                    self._cond.wait(timeout=delay)
+        except BaseException:
+            with self._cond:
+                self._waiting.pop(ticket, None)
+                self._cond.notify_all()
+            raise
+
+    def release(self, handle):
+        _unlock_slot(handle)
+        with self._cond:
+            self._cond.notify_all()
+
+    def snapshot(self):
+        # Running counts held slots of every process (shard workers included), queued only this server
+        with self._cond:
+            queued = len(self._waiting)
+        return {"active": _held_slots(self.name), "queued": queued}
+
+
+_schedulers = {}
+_registry_lock = threading.Lock()
+
+
+def get_scheduler(provider):
+    with _registry_lock:
+        if provider not in _schedulers:
+            _schedulers[provider] = ProviderScheduler(provider)
+        return _schedulers[provider]
+
+
+def _try_lock_slot(provider):
+    # A slot is an exclusive flock on one of max_concurrent files; the OS frees it if a process dies
+    os.makedirs(RATE_LIMIT_DIR, exist_ok=True)
+    for i in range(PROVIDER_LIMITS[provider]["max_concurrent"]):
+        handle = open(os.path.join(RATE_LIMIT_DIR, f"{provider}.slot{i}"), "a")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return handle
+        except BlockingIOError:
+            handle.close()
+    return None
+
+
+def _unlock_slot(handle):
+    try:
+        fcntl.flock(handle, fcntl.LOCK_UN)
+    finally:
+        handle.close()
+
+
+def _held_slots(provider):
+    # flock has no query, so probe each slot file with a non-blocking lock and release it right away
+    held = 0
+    for i in range(PROVIDER_LIMITS[provider]["max_concurrent"]):
+        path = os.path.join(RATE_LIMIT_DIR, f"{provider}.slot{i}")
+        if not os.path.exists(path):
+            continue
+        with open(path, "a") as handle:
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                held += 1
+            else:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+    return held
+
+
+def _mark_session_waiting(provider):
+    os.makedirs(RATE_LIMIT_DIR, exist_ok=True)
+    with open(os.path.join(RATE_LIMIT_DIR, f"{provider}.waiting"), "a"):
+        pass
+    os.utime(os.path.join(RATE_LIMIT_DIR, f"{provider}.waiting"))
+
+
+def _session_waiting(provider):
+    try:
+        touched = os.path.getmtime(os.path.join(RATE_LIMIT_DIR, f"{provider}.waiting"))
+    except FileNotFoundError:
+        return False
+    return time.time() - touched < 2 * POLL_INTERVAL
+
+
+def pace(provider):
+    # Reserve the next start time under a file lock, then sleep until it outside the lock
+    os.makedirs(RATE_LIMIT_DIR, exist_ok=True)
+    interval = PROVIDER_LIMITS[provider]["min_interval"]
+    with open(os.path.join(RATE_LIMIT_DIR, f"{provider}.next"), "a+") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            f.seek(0)
+            content = f.read().strip()
+            now = time.time()
+            start = max(now, float(content) if content else 0.0)
+            f.seek(0)
+            f.truncate()
+            f.write(str(start + interval))
+            f.flush()
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+    if start > now:
+        time.sleep(start - now)
+
+
+@contextmanager
+def slot(provider, user, on_wait=None):
+    scheduler = get_scheduler(provider)
+    handle = scheduler.acquire(user, on_wait=on_wait)
+    try:
+        pace(provider)
+        yield
+    finally:
+        scheduler.release(handle)
+
+
+@contextmanager
+def worker_slot(provider):
+    # Used by shard workers in other processes, one request at a time
+    handle = None
+    while handle is None:
+        if not _session_waiting(provider):
+            handle = _try_lock_slot(provider)
+        if handle is None:
+            time.sleep(POLL_INTERVAL)
+    try:
+        pace(provider)
+        yield
+    finally:
+        _unlock_slot(handle)
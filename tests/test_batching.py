@@ -0,0 +1,62 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batching import AdaptiveBatcher
+
+
+def run(batcher, fails, split=True):
+    calls = 0
+    slept = 0
+    while batcher:
+        batch, attempt = batcher.next_batch()
+        calls += 1
+        if fails(calls, batch):
+            batcher.record_failure(batch, attempt, split=split)
+            slept += batcher.backoff(5)
+        else:
+            batcher.record_success(batch, 1.0)
+    return calls, slept
+
+
+def test_error_streak_pauses_instead_of_failing_remaining_items():
+    batcher = AdaptiveBatcher(list(range(5000)), max_size=1000)
+    run(batcher, lambda calls, batch: calls <= 6)
+
+    assert batcher.failed_items == []
+    assert batcher.abandoned_items == 0
+    assert batcher.done == 5000
+
+
+def test_bad_item_is_isolated_by_bisection():
+    batcher = AdaptiveBatcher(list(range(1000)), max_size=1000)
+    run(batcher, lambda calls, batch: 17 in batch)
+
+    assert batcher.failed_items == [17]
+    assert batcher.done == 1000
+
+
+def test_provider_down_stops_the_run():
+    for split in (True, False):
+        batcher = AdaptiveBatcher(list(range(5000)), max_size=1000)
+        calls, slept = run(batcher, lambda calls, batch: True, split=split)
+
+        assert calls <= batcher.max_consecutive_errors * (batcher.max_pauses + 1)
+        assert slept < 15 * 60
+        assert sorted(batcher.failed_items) == list(range(5000))
+        assert batcher.abandoned_items == 5000
+
+
+def test_provider_errors_retry_the_whole_batch():
+    batcher = AdaptiveBatcher(list(range(1000)), max_size=1000)
+    sizes = []
+
+    def fails(calls, batch):
+        sizes.append(len(batch))
+        return calls <= 2
+
+    run(batcher, fails, split=False)
+
+    assert sizes[:3] == [1000, 1000, 1000]
+    assert batcher.failed_items == []
@@ -0,0 +1,116 @@
+import importlib.util
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import dataforseo
+
+
+def test_brotli_is_only_advertised_when_it_can_be_decoded():
+    has_brotli = any(importlib.util.find_spec(name) for name in ("brotli", "brotlicffi"))
+
+    assert ("br" in dataforseo.ACCEPT_ENCODING) == has_brotli
+    assert "gzip" in dataforseo.ACCEPT_ENCODING
+
+
+PARAM = {"target_location": "Germany", "target_language": "German", "region": "Europe"}
+
+
+def monthly(*volumes):
+    return [{"year": 2024, "month": month, "search_volume": volume} for month, volume in enumerate(volumes, 1)]
+
+
+def response(result, **task):
+    # Shaped like a real search_volume/live response, with the fields we don't read left in
+    return {
+        "version": "0.1.20240801",
+        "status_code": 20000,
+        "status_message": "Ok.",
+        "time": "0.3 sec.",
+        "cost": 0.075,
+        "tasks_count": 1,
+        "tasks": [{
+            "id": "08011234-1234-0367-0000-9a1d2e3f4b5c",
+            "status_code": 20000,
+            "status_message": "Ok.",
+            "cost": 0.075,
+            "result_count": len(result or []),
+            "path": ["v3", "keywords_data", "google_ads", "search_volume", "live"],
+            "data": {"api": "keywords_data", "function": "search_volume", "keywords": ["a", "b"]},
+            "result": result,
+            **task,
+        }],
+    }
+
+
+def encode(document, **kwargs):
+    return json.dumps(document, **kwargs).encode("utf-8")
+
+
+def test_parse_response_skips_fields_it_does_not_read():
+    body = encode(response([
+        {
+            "keyword": "a",
+            "spell": None,
+            "location_code": 2276,
+            "competition": "LOW",
+            "competition_index": 12,
+            "cpc": 0.41,
+            "search_volume": 30,
+            "monthly_searches": monthly(10, 20),
+        },
+        {"keyword": "b", "competition": None, "search_volume": None, "monthly_searches": None},
+    ]))
+
+    rows = dataforseo.parse_results(dataforseo.parse_response(body), PARAM, "test")
+
+    assert rows[0] == {
+        "Category": "test",
+        "Language": "German",
+        "Region": "Europe",
+        "Country": "Germany",
+        "Keyword": "a",
+        "01-2024": 10,
+        "02-2024": 20,
+        "Total Volume": 30,
+    }
+    assert rows[1]["Keyword"] == "b"
+    assert rows[1]["Total Volume"] is None
+    assert "01-2024" not in rows[1]
+
+
+def test_parse_response_returns_none_for_a_task_without_result():
+    assert dataforseo.parse_response(encode(response(None))) is None
+
+
+def test_parse_response_raises_task_errors():
+    body = encode(response(None, status_code=40501, status_message="Invalid Field: 'keywords'."))
+
+    with pytest.raises(dataforseo.TaskError) as error:
+        dataforseo.parse_response(body)
+    assert error.value.status_code == 40501
+    assert dataforseo.is_batch_error(error.value)
+
+
+def test_parse_response_reads_pretty_printed_json():
+    body = encode(response([{"keyword": "a", "monthly_searches": monthly(5)}]), indent=4)
+
+    rows = dataforseo.parse_results(dataforseo.parse_response(body), PARAM, "test")
+
+    assert rows[0]["01-2024"] == 5
+    assert rows[0]["Total Volume"] == 5
+
+
+def test_parse_response_falls_back_to_json_loads():
+    # Arrow's JSON reader rejects 10.0 for an int64 field, the Python conversion accepts it
+    result = [{"keyword": "a", "monthly_searches": [{"year": 2024, "month": 1, "search_volume": 10.0}]}]
+    body = encode(response(result))
+
+    rows = dataforseo.parse_results(dataforseo.parse_response(body), PARAM, "test")
+
+    assert rows[0]["01-2024"] == 10
+    assert rows[0]["Total Volume"] == 10
@@ -0,0 +1,85 @@
+import json
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dataforseo
+import process_jobs
+import scheduler
+
+PARAM = {"target_location": "Germany", "target_language": "German", "region": "Europe"}
+
+
+def fake_fetch_results(url, headers, payload, **kwargs):
+    entries = []
+    for keyword in payload[0]["keywords"]:
+        monthly = None if keyword == "zero" else [
+            {"year": 2024, "month": month, "search_volume": 10 * month} for month in (1, 2)
+        ]
+        entries.append({"keyword": keyword, "monthly_searches": monthly})
+    return dataforseo.parse_response(json.dumps({"tasks": [{"result": entries}]}).encode("utf-8"))
+
+
+def make_shard(keywords):
+    return {
+        "id": 0,
+        "param": PARAM,
+        "location_code": 2276,
+        "language_code": "de",
+        "keywords": keywords,
+        "batch_size": 1000,
+        "url": "http://example.invalid",
+        "headers": {},
+        "date_from": "2024-01-01",
+        "date_to": "2024-02-01",
+        "sort_by": "search_volume",
+        "include_adult_keywords": True,
+        "category": "test",
+        "compress_request": False,
+    }
+
+
+def test_run_shard_keeps_month_columns_when_first_keyword_has_no_volume(monkeypatch, tmp_path):
+    monkeypatch.setattr(dataforseo, "fetch_results", fake_fetch_results)
+    monkeypatch.setattr(scheduler, "RATE_LIMIT_DIR", str(tmp_path))
+    monkeypatch.setattr(scheduler, "PROVIDER_LIMITS", {"dataforseo": {"max_concurrent": 1, "min_interval": 0.0}})
+
+    _, table, failed_terms, _, errors, _ = process_jobs.run_shard(make_shard(["zero", "a", "b"]))
+
+    assert failed_terms == []
+    assert errors == []
+    assert {"01-2024", "02-2024"} <= set(table.column_names)
+    rows = {row["Keyword"]: row for row in table.to_pylist()}
+    assert rows["a"]["01-2024"] == 10
+    assert rows["a"]["Total Volume"] == 30
+    assert rows["zero"]["Total Volume"] is None
+
+
+def test_merge_shards_unions_columns_across_shards(monkeypatch, tmp_path):
+    monkeypatch.setattr(dataforseo, "fetch_results", fake_fetch_results)
+    monkeypatch.setattr(scheduler, "RATE_LIMIT_DIR", str(tmp_path))
+    monkeypatch.setattr(scheduler, "PROVIDER_LIMITS", {"dataforseo": {"max_concurrent": 1, "min_interval": 0.0}})
+
+    _, only_zero, *_ = process_jobs.run_shard(make_shard(["zero"]))
+    _, with_volume, *_ = process_jobs.run_shard(make_shard(["a"]))
+    merged = process_jobs.merge_shards([only_zero, with_volume])
+
+    assert merged.num_rows == 2
+    assert {"01-2024", "02-2024"} <= set(merged.column_names)
+    assert merged.to_pylist()[0]["Keyword"] == "a"
+
+
+def test_cancelled_shard_sends_nothing_and_fails_its_keywords(monkeypatch, tmp_path):
+    def fetch_results(*args, **kwargs):
+        raise AssertionError("a cancelled shard must not call the API")
+
+    monkeypatch.setattr(dataforseo, "fetch_results", fetch_results)
+    cancel = threading.Event()
+    cancel.set()
+
+    _, table, failed_terms, _, errors, _ = process_jobs.run_shard(make_shard(["a", "b"]), cancel)
+
+    assert table.num_rows == 0
+    assert failed_terms == [("Germany", "a"), ("Germany", "b")]
@@ -0,0 +1,57 @@
+import datetime as dt
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import warehouse
+
+DESCRIPTION = {"Category": "test", "Language": "German", "Region": "Europe", "Country": "Germany"}
+
+
+def fill_warehouse(monkeypatch, tmp_path):
+    monkeypatch.setattr(warehouse, "WAREHOUSE_DIR", str(tmp_path / "warehouse"))
+    # DataForSEO pull: zero-padded MM-YYYY columns plus the non-month Total Volume
+    warehouse.append_volumes(pd.DataFrame([
+        {**DESCRIPTION, "Keyword": "a", "12-2023": 5, "01-2024": 10, "02-2024": 20, "Total Volume": 35},
+        {**DESCRIPTION, "Keyword": "b", "12-2023": 1, "01-2024": 2, "02-2024": None, "Total Volume": 3},
+    ]), source="dataforseo", pulled_at=dt.datetime(2024, 3, 1))
+    # Later Google Ads pull of the same keyword: M-YYYY columns
+    warehouse.append_volumes(pd.DataFrame([
+        {**DESCRIPTION, "Keyword": "a", "1-2024": 100, "2-2024": 200},
+    ]), source="google_ads", pulled_at=dt.datetime(2024, 4, 1))
+
+
+def test_latest_only_keeps_the_freshest_pull_per_month(monkeypatch, tmp_path):
+    fill_warehouse(monkeypatch, tmp_path)
+
+    everything = warehouse.query_volumes(latest_only=False)
+    latest = warehouse.query_volumes(locations=["Germany"], year_from=2024)
+
+    assert len(everything) == 7
+    volumes = {(row.keyword, row.month): (row.search_volume, row.source) for row in latest.itertuples()}
+    assert volumes == {
+        ("a", 1): (100, "google_ads"),
+        ("a", 2): (200, "google_ads"),
+        ("b", 1): (2, "dataforseo"),
+    }
+
+
+def test_aggregations(monkeypatch, tmp_path):
+    fill_warehouse(monkeypatch, tmp_path)
+    df = warehouse.query_volumes()
+
+    monthly = warehouse.aggregate_volumes(df, "Monthly")
+    assert list(monthly.columns) == ["keyword", "location", "language", "12-2023", "01-2024", "02-2024", "Total Volume"]
+    assert monthly.set_index("keyword").loc["a", "Total Volume"] == 305
+
+    yearly = warehouse.aggregate_volumes(df, "Yearly")
+    assert list(yearly.columns) == ["keyword", "location", "language", "2023", "2024", "Total Volume"]
+    assert yearly.set_index("keyword").loc["a", "2024"] == 300
+
+    total = warehouse.aggregate_volumes(df, "Total")
+    assert list(total.columns) == ["keyword", "location", "language", "Total Volume"]
+    assert total["keyword"].tolist() == ["a", "b"]
+    assert total["Total Volume"].tolist() == [305, 3]
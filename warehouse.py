@@ -0,0 +1,169 @@
+import datetime as dt
+import os
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# --- CONFIG ---
+# Every finished pull is appended here as long-format Parquet, partitioned by location/year
+WAREHOUSE_DIR = os.getenv("WAREHOUSE_DIR", "warehouse")
+
+DESCRIPTION_COLS = {
+    "Category": "category",
+    "Language": "language",
+    "Region": "region",
+    "Country": "location",
+    "Keyword": "keyword",
+}
+
+PARTITIONING = ds.partitioning(
+    pa.schema([("location", pa.string()), ("year", pa.int16())]),
+    flavor="hive",
+)
+
+SCHEMA = pa.schema([
+    ("keyword", pa.string()),
+    ("month", pa.int8()),
+    ("search_volume", pa.int64()),
+    ("category", pa.string()),
+    ("language", pa.string()),
+    ("region", pa.string()),
+    ("source", pa.string()),
+    ("pulled_at", pa.timestamp("s")),
+    ("location", pa.string()),
+    ("year", pa.int16()),
+])
+
+
+def _parse_month(column):
+    # Pull columns are named "MM-YYYY" (DataForSEO) or "M-YYYY" (Google Ads)
+    try:
+        parsed = dt.datetime.strptime(str(column), "%m-%Y")
+    except ValueError:
+        return None
+    return parsed.year, parsed.month
+
+
+def to_long(df, source, pulled_at=None):
+    pulled_at = pulled_at or dt.datetime.now().replace(microsecond=0)
+    id_cols = [c for c in DESCRIPTION_COLS if c in df.columns]
+    months = {c: _parse_month(c) for c in df.columns if c not in id_cols}
+    months = {c: ym for c, ym in months.items() if ym is not None}
+
+    long = df[id_cols + list(months)].melt(
+        id_vars=id_cols, var_name="period", value_name="search_volume"
+    )
+    long = long.dropna(subset=["search_volume"]).rename(columns=DESCRIPTION_COLS)
+    long["year"] = long["period"].map(lambda c: months[c][0])
+    long["month"] = long["period"].map(lambda c: months[c][1])
+    long["source"] = source
+    long["pulled_at"] = pd.Timestamp(pulled_at)
+    for col in SCHEMA.names:
+        if col not in long.columns:
+            long[col] = None
+    long["keyword"] = long["keyword"].astype(str)
+    return long[SCHEMA.names]
+
+
+def append_volumes(df, source, pulled_at=None):
+    long = to_long(df, source, pulled_at)
+    if long.empty:
+        return 0
+    table = pa.Table.from_pandas(long, schema=SCHEMA, preserve_index=False)
+    pq.write_to_dataset(
+        table,
+        WAREHOUSE_DIR,
+        partitioning=PARTITIONING,
+        basename_template=f"{source}-{uuid.uuid4().hex}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+    )
+    return table.num_rows
+
+
+def _dataset():
+    if not os.path.isdir(WAREHOUSE_DIR):
+        return None
+    return ds.dataset(WAREHOUSE_DIR, schema=SCHEMA, format="parquet", partitioning=PARTITIONING)
+
+
+def files_signature():
+    # Cheap fingerprint of the store: changes whenever append_volumes writes a file
+    if not os.path.isdir(WAREHOUSE_DIR):
+        return ()
+    signature = []
+    for root, _, files in os.walk(WAREHOUSE_DIR):
+        for name in files:
+            stat = os.stat(os.path.join(root, name))
+            signature.append((os.path.join(root, name), stat.st_mtime_ns, stat.st_size))
+    return tuple(sorted(signature))
+
+
+def distinct_values(columns):
+    # One scan over the given columns instead of one scan per filter
+    dataset = _dataset()
+    if dataset is None:
+        return {column: [] for column in columns}
+    table = dataset.to_table(columns=list(columns))
+    return {
+        column: sorted(v for v in table.column(column).unique().to_pylist() if v is not None)
+        for column in columns
+    }
+
+
+def query_volumes(keywords=None, locations=None, languages=None, categories=None,
+                  sources=None, year_from=None, year_to=None, latest_only=True):
+    dataset = _dataset()
+    if dataset is None:
+        return pd.DataFrame(columns=SCHEMA.names)
+
+    # Partition filters (location/year) prune whole directories, the rest is pushed to row groups
+    filters = []
+    if locations:
+        filters.append(ds.field("location").isin(list(locations)))
+    if year_from is not None:
+        filters.append(ds.field("year") >= year_from)
+    if year_to is not None:
+        filters.append(ds.field("year") <= year_to)
+    if keywords:
+        filters.append(ds.field("keyword").isin([str(k) for k in keywords]))
+    if languages:
+        filters.append(ds.field("language").isin(list(languages)))
+    if categories:
+        filters.append(ds.field("category").isin(list(categories)))
+    if sources:
+        filters.append(ds.field("source").isin(list(sources)))
+
+    expression = None
+    for f in filters:
+        expression = f if expression is None else expression & f
+
+    df = dataset.to_table(filter=expression).to_pandas()
+    if latest_only and not df.empty:
+        # The same keyword/month can come from several pulls, keep the freshest one
+        df = df.sort_values("pulled_at").drop_duplicates(
+            subset=["keyword", "location", "language", "year", "month"], keep="last"
+        )
+    return df.reset_index(drop=True)
+
+
+def aggregate_volumes(df, mode):
+    keys = ["keyword", "location", "language"]
+    if df.empty:
+        return df
+    if mode == "Monthly":
+        df = df.assign(period=df["month"].astype(int).astype(str).str.zfill(2) + "-" + df["year"].astype(str))
+        wide = df.pivot_table(index=keys, columns="period", values="search_volume", aggfunc="sum")
+        ordered = sorted(wide.columns, key=lambda c: _parse_month(c))
+        wide = wide[ordered]
+        wide["Total Volume"] = wide.sum(axis=1)
+        return wide.reset_index().sort_values("Total Volume", ascending=False)
+    if mode == "Yearly":
+        yearly = df.pivot_table(index=keys, columns="year", values="search_volume", aggfunc="sum")
+        yearly.columns = [str(c) for c in yearly.columns]
+        yearly["Total Volume"] = yearly.sum(axis=1)
+        return yearly.reset_index().sort_values("Total Volume", ascending=False)
+    total = df.groupby(keys, as_index=False)["search_volume"].sum()
+    return total.rename(columns={"search_volume": "Total Volume"}).sort_values("Total Volume", ascending=False)